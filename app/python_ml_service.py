@@ -4,25 +4,300 @@ Python ML Service for CreditMaster Pro
 Loads and uses the actual trained Hugging Face credit scoring model
 """
 
+import os
 import sys
+import csv
 import json
-import joblib
+import logging
+import threading
 import numpy as np
-import pandas as pd
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Dict, List, Any, Tuple
+from typing import Callable, Dict, List, Any, NamedTuple, Optional, Tuple
 import warnings
-warnings.filterwarnings('ignore')
+
+logger = logging.getLogger(__name__)
+
+# Models trained on a DataFrame warn on every predict call with a plain array.
+# The columns are always passed in feature_names order, so the warning is noise.
+warnings.filterwarnings('ignore', message='X does not have valid feature names', category=UserWarning)
+
+# joblib (and with it sklearn), numba and onnxruntime are imported where they
+# are first needed, so short CLI invocations only load what they use
+
+DEFAULT_MODEL_PATH = "models/credit_classifier.joblib"
+DEFAULT_ONNX_MODEL_PATH = "models/credit_classifier.onnx"
+
+# ONNX metadata entry holding the exported classifier's classes_ as JSON
+ONNX_CLASSES_METADATA_KEY = "classes"
+
+# Batches smaller than this are scored in one call on the calling thread;
+# below it, thread start-up costs more than splitting the model call saves
+PARALLEL_MIN_ROWS = 1024
+
+# Confidence reported when the model can't give class probabilities
+DEFAULT_CONFIDENCE = 0.85
+
+# Distinct feature vectors whose probabilities each service remembers
+PREDICTION_CACHE_SIZE = 4096
+
+# Base credit score per model category: Good, Poor, Standard
+_BASE_SCORES = np.array([750, 580, 650], dtype=np.int64)
+
+
+def _scores_from_categories(categories: np.ndarray, adjustments: np.ndarray) -> np.ndarray:
+    """Add adjustments to each category's base score, clamped to [300, 850]"""
+    scores = np.empty_like(adjustments)
+    for i in range(categories.shape[0]):
+        score = _BASE_SCORES[categories[i]] + adjustments[i]
+        scores[i] = max(300, min(850, score))
+    return scores
+
+
+def _forest_predict_proba(roots: np.ndarray, feature: np.ndarray, threshold: np.ndarray,
+                          left: np.ndarray, right: np.ndarray, value: np.ndarray,
+                          x: np.ndarray) -> np.ndarray:
+    """Average class probabilities of a flattened forest for the single row x[0]"""
+    proba = np.zeros(value.shape[1])
+    for root in roots:
+        node = root
+        while left[node] != -1:
+            if x[0, feature[node]] <= threshold[node]:
+                node = left[node]
+            else:
+                node = right[node]
+        proba += value[node]
+    return proba / roots.shape[0]
+
+
+class _NumbaKernels(NamedTuple):
+    scores_from_categories: Callable[[np.ndarray, np.ndarray], np.ndarray]
+    forest_predict_proba: Callable[..., np.ndarray]
+
+
+@lru_cache(maxsize=None)
+def _numba_kernels() -> Optional[_NumbaKernels]:
+    """Compile the numba kernels on first use, or None if numba is unavailable"""
+    try:
+        from numba import njit
+    except ImportError:  # numba is optional; callers fall back to numpy / sklearn
+        return None
+    
+    try:
+        return _NumbaKernels(
+            # Compiled (or loaded from the disk cache) here, on first use. For
+            # forests that is load_model; otherwise the first batch_predict pays it
+            scores_from_categories=njit('int64[:](int64[:], int64[:])', cache=True)(_scores_from_categories),
+            forest_predict_proba=njit(cache=True)(_forest_predict_proba),
+        )
+    except Exception as e:
+        # cache=True raises when no cache directory is writable, as on
+        # read-only deploys; fall back rather than fail every prediction
+        logger.warning("Could not compile numba kernels, using numpy / sklearn: %s", e)
+        return None
+
+
+def _flatten_forest(model: Any) -> Optional[Tuple[np.ndarray, ...]]:
+    """
+    Concatenate the trees of a random forest classifier into flat node arrays
+    
+    Returns:
+        (roots, feature, threshold, left, right, value) for
+        _forest_predict_proba, or None if model is not a supported forest
+    """
+    if type(model).__name__ not in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+        return None
+    if getattr(model, 'n_outputs_', 1) != 1:
+        return None
+    
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    roots = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+    
+    # Child indices are offset by each tree's root so they index the flat arrays
+    left = np.concatenate([
+        np.where(tree.children_left == -1, -1, tree.children_left + root)
+        for tree, root in zip(trees, roots)
+    ])
+    right = np.concatenate([
+        np.where(tree.children_right == -1, -1, tree.children_right + root)
+        for tree, root in zip(trees, roots)
+    ])
+    value = np.concatenate([
+        tree.value[:, 0, :] / tree.value[:, 0, :].sum(axis=1, keepdims=True)
+        for tree in trees
+    ])
+    
+    return (
+        roots.astype(np.int64),
+        np.concatenate([tree.feature for tree in trees]).astype(np.int64),
+        np.concatenate([tree.threshold for tree in trees]),
+        left.astype(np.int64),
+        right.astype(np.int64),
+        np.ascontiguousarray(value),
+    )
+
+
+def _is_tree_model(model: Any) -> bool:
+    """Whether model is a sklearn tree or an ensemble of sklearn trees"""
+    if hasattr(model, 'tree_'):
+        return True
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None or len(estimators) == 0:
+        return False
+    return hasattr(np.ravel(estimators)[0], 'tree_')
+
+
+class _ScratchRow(threading.local):
+    """
+    Reused (1, n) input array for single-row predictions, one per thread
+    
+    Each thread gets its own array on first access, so concurrent
+    predictions on one service never overwrite each other's input.
+    """
+    
+    def __init__(self, n_features: int, dtype: type):
+        self.array = np.empty((1, n_features), dtype=dtype)
+
+
+def _make_row_proba(predict_proba_row: Callable[[np.ndarray], np.ndarray],
+                    scratch: _ScratchRow) -> Callable[[Tuple[float, ...]], Tuple[float, ...]]:
+    """
+    Specialize the single-row probability call for one model
+    
+    The backend and the per-thread input buffer are bound once as closure
+    variables, so each call fills the row and calls the backend without any
+    attribute lookups on the service.
+    """
+    def row_proba(features: Tuple[float, ...]) -> Tuple[float, ...]:
+        features_array = scratch.array
+        features_array[0, :] = features
+        return tuple(predict_proba_row(features_array).tolist())
+    
+    return row_proba
+
+
+class _ProbaStrategy:
+    """Scores a row from its class probabilities, for models with predict_proba"""
+    
+    def __init__(self, row_proba: Callable[[Tuple[float, ...]], Tuple[float, ...]],
+                 classes: np.ndarray, labels: Tuple[str, ...],
+                 feature_importance: Optional[Dict[str, float]]):
+        self.row_proba = row_proba
+        self.classes = classes.tolist()
+        self.labels = labels
+        self.feature_importance = feature_importance
+    
+    def score(self, features: List[float]) -> Tuple[int, float, Optional[Dict[str, float]], Optional[Dict[str, float]]]:
+        """Return (category, confidence, probabilities, feature importance)"""
+        # The label is the most probable class, as sklearn's predict computes
+        # it, so the model is walked once rather than again by predict
+        proba = self.row_proba(tuple(features))
+        best = max(range(len(proba)), key=proba.__getitem__)
+        return self.classes[best], proba[best], dict(zip(self.labels, proba)), self.feature_importance
+
+
+class _PredictOnlyStrategy:
+    """Scores a row from the predicted label alone, with the default confidence"""
+    
+    def __init__(self, predict: Callable[[np.ndarray], np.ndarray], scratch: _ScratchRow,
+                 feature_importance: Optional[Dict[str, float]]):
+        self.predict = predict
+        self.scratch = scratch
+        self.feature_importance = feature_importance
+    
+    def score(self, features: List[float]) -> Tuple[int, float, Optional[Dict[str, float]], Optional[Dict[str, float]]]:
+        """Return (category, confidence, probabilities, feature importance)"""
+        features_array = self.scratch.array
+        features_array[0, :] = features
+        return int(self.predict(features_array)[0]), DEFAULT_CONFIDENCE, None, self.feature_importance
+
+
+class OnnxClassifier:
+    """
+    predict / predict_proba over an onnxruntime session
+    
+    Wraps models written by export_onnx_model so the service can use them in
+    place of the sklearn estimator. onnxruntime runs the trees in its native
+    kernels, avoiding sklearn's Python-level dispatch on every call.
+    """
+    
+    def __init__(self, session: Any):
+        classes = session.get_modelmeta().custom_metadata_map.get(ONNX_CLASSES_METADATA_KEY)
+        if classes is None:
+            raise ValueError(
+                f"ONNX model has no '{ONNX_CLASSES_METADATA_KEY}' metadata; "
+                "re-export it with export_onnx_model"
+            )
+        
+        self.session = session
+        self.classes_ = np.array(json.loads(classes))
+        self._input_name = session.get_inputs()[0].name
+        self._label_name, self._proba_name = [output.name for output in session.get_outputs()[:2]]
+    
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predict class labels for X"""
+        inputs = {self._input_name: np.asarray(X, dtype=np.float32)}
+        return self.session.run([self._label_name], inputs)[0]
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Predict class probabilities for X"""
+        inputs = {self._input_name: np.asarray(X, dtype=np.float32)}
+        proba = self.session.run([self._proba_name], inputs)[0]
+        # onnxruntime sums the tree probabilities in float32, so they can
+        # differ from sklearn's float64 results by float32 accumulation
+        # error (0.7199998 for 0.72). Returned as float64, like sklearn.
+        return proba.astype(np.float64)
+
+
+def export_onnx_model(model_path: str, onnx_path: str) -> None:
+    """
+    Convert a joblib-saved sklearn classifier to ONNX (requires skl2onnx)
+    
+    Probabilities are exported as a plain (N, n_classes) tensor rather than
+    skl2onnx's default list of dicts, and the model's classes_ are stored in
+    the ONNX metadata, as OnnxClassifier expects.
+    """
+    import joblib
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+    
+    model = joblib.load(model_path)
+    n_features = getattr(model, 'n_features_in_', 7)
+    onnx_model = convert_sklearn(
+        model,
+        initial_types=[('input', FloatTensorType([None, n_features]))],
+        options={id(model): {'zipmap': False}}
+    )
+    classes = onnx_model.metadata_props.add()
+    classes.key = ONNX_CLASSES_METADATA_KEY
+    classes.value = json.dumps(np.asarray(model.classes_).tolist())
+    Path(onnx_path).write_bytes(onnx_model.SerializeToString())
+
 
 class CreditMLService:
     """
     Production ML Service using the actual Hugging Face trained model
     """
     
-    def __init__(self, model_path: str = "models/credit_classifier.joblib"):
-        """Initialize the ML service with the trained model"""
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH,
+                 n_jobs: Optional[int] = None, mmap_mode: Optional[str] = 'r'):
+        """
+        Initialize the ML service with the trained model
+        
+        Args:
+            model_path: Path to the trained model
+            n_jobs: Threads used to score large batches. Defaults to half
+                the available CPUs.
+            mmap_mode: joblib.load mmap_mode for joblib models. With the
+                default 'r', numpy arrays stored uncompressed in the model
+                file are memory-mapped read-only, so worker processes loading
+                the same file share those pages instead of each holding a
+                copy. None reads the whole model into memory.
+        """
         self.model_path = Path(model_path)
         self.model = None
+        self.n_jobs = n_jobs if n_jobs is not None else max(1, (os.cpu_count() or 1) // 2)
+        self.mmap_mode = mmap_mode
         self.feature_names = [
             'Outstanding_Debt',
             'Credit_Mix', 
@@ -37,62 +312,210 @@ class CreditMLService:
             1: 'Poor',
             2: 'Standard'
         }
+        self._category_names = np.array(
+            [self.credit_categories[i] for i in range(len(self.credit_categories))]
+        )
+        self._rng = np.random.default_rng()
+        
+        # Input dtype and the per-thread reused input row for single
+        # predictions, both set in load_model
+        self._input_dtype = np.float64
+        self._max_input_value = float(np.finfo(np.float64).max)
+        self._scratch = None
+        
+        # Resolved once in load_model so predictions don't re-probe the model
+        self._predict = None
+        self._predict_proba = None
+        self._predict_proba_row = None
+        self._strategy = None
+        self._label_strategy = None
+        self._classes = None
+        self._category_labels = None
+        self._feature_importances = None
+        self._feature_importance_dict = None
+        self._model_type_name = None
+        
         self.load_model()
     
     def load_model(self) -> None:
         """Load the trained model from file"""
         try:
             if self.model_path.exists():
-                print(f"Loading model from {self.model_path}")
-                self.model = joblib.load(self.model_path)
-                print(f"Model loaded successfully: {type(self.model).__name__}")
+                logger.info("Loading model from %s", self.model_path)
+                if self.model_path.suffix == '.onnx':
+                    import onnxruntime
+                    session = onnxruntime.InferenceSession(
+                        str(self.model_path), providers=['CPUExecutionProvider']
+                    )
+                    self.model = OnnxClassifier(session)
+                else:
+                    # mmap only applies to uncompressed joblib files, and sklearn
+                    # trees copy their node arrays into their own buffers when
+                    # unpickled. Load once per worker process (not in a forked
+                    # parent whose model is then re-pickled to workers) to keep
+                    # the mapped pages shared.
+                    import joblib
+                    # Models pickled by another sklearn version warn on load
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore')
+                        self.model = joblib.load(self.model_path, mmap_mode=self.mmap_mode)
+                
+                self._predict = self.model.predict
+                self._predict_proba = getattr(self.model, 'predict_proba', None)
+                self._model_type_name = type(self.model).__name__
+                
+                # Class label and display name of each predict_proba column.
+                # Labels are category indices; models trained on float labels
+                # (0.0, 1.0, 2.0) report them as floats.
+                self._classes = np.asarray(getattr(
+                    self.model, 'classes_', np.arange(len(self.credit_categories))
+                )).astype(np.int64)
+                self._category_labels = tuple(
+                    self.credit_categories[c] for c in self._classes.tolist()
+                )
+                
+                # sklearn trees compare features as float32 and cast any other
+                # input to it, so feed them float32 directly to skip that copy.
+                # Credit_Mix and the counts are small integers, exact in float32.
+                # ONNX models are exported with a float32 input.
+                if isinstance(self.model, OnnxClassifier) or _is_tree_model(self.model):
+                    self._input_dtype = np.float32
+                else:
+                    self._input_dtype = np.float64
+                self._max_input_value = float(np.finfo(self._input_dtype).max)
+                self._scratch = _ScratchRow(len(self.feature_names), self._input_dtype)
+                
+                # Single-row probabilities: walk a forest's trees in a compiled
+                # loop when numba is available, skipping sklearn's per-call input
+                # validation and thread dispatch. Batches still use sklearn.
+                forest = _flatten_forest(self.model)
+                kernels = _numba_kernels() if forest is not None else None
+                if kernels is not None:
+                    self._predict_proba_row = partial(kernels.forest_predict_proba, *forest)
+                    # Compile before the first request
+                    self._predict_proba_row(np.zeros((1, len(self.feature_names)), dtype=self._input_dtype))
+                elif self._predict_proba is not None:
+                    self._predict_proba_row = self._sklearn_predict_proba_row
+                else:
+                    self._predict_proba_row = None
+                
+                # feature_importances_ is recomputed from every tree on access
+                # for forests, and never changes between predictions
+                try:
+                    self._feature_importances = getattr(self.model, 'feature_importances_', None)
+                except Exception as e:
+                    logger.warning("Could not get feature importance: %s", e)
+                    self._feature_importances = None
+                if self._feature_importances is not None:
+                    self._feature_importance_dict = dict(
+                        zip(self.feature_names, np.asarray(self._feature_importances).tolist())
+                    )
+                else:
+                    self._feature_importance_dict = None
+                
+                # Pick how single rows are scored now, so predictions don't
+                # branch on the model's capabilities
+                self._label_strategy = _PredictOnlyStrategy(
+                    self._predict, self._scratch, self._feature_importance_dict
+                )
+                if self._predict_proba_row is not None:
+                    # Clients often resubmit the same feature vector; remember the
+                    # probabilities per vector. Recreated here, so a reloaded model
+                    # never serves results cached from the previous one.
+                    row_proba = lru_cache(maxsize=PREDICTION_CACHE_SIZE)(
+                        _make_row_proba(self._predict_proba_row, self._scratch)
+                    )
+                    self._strategy = _ProbaStrategy(
+                        row_proba, self._classes, self._category_labels,
+                        self._feature_importance_dict
+                    )
+                else:
+                    self._strategy = self._label_strategy
+                
+                logger.info("Model loaded successfully: %s", self._model_type_name)
                 
                 # Print model info if available
                 if hasattr(self.model, 'n_estimators'):
-                    print(f"Model details: {self.model.n_estimators} estimators")
-                if hasattr(self.model, 'feature_importances_'):
-                    print("Feature importances available")
+                    logger.info("Model details: %s estimators", self.model.n_estimators)
+                if self._feature_importances is not None:
+                    logger.info("Feature importances available")
                     
             else:
                 raise FileNotFoundError(f"Model file not found: {self.model_path}")
                 
         except Exception as e:
-            print(f"Error loading model: {e}")
+            logger.error("Error loading model: %s", e)
             raise
     
+    def _sklearn_predict_proba_row(self, features_array: np.ndarray) -> np.ndarray:
+        """Class probabilities for a single-row array from the sklearn model"""
+        return self._predict_proba(features_array)[0]
+    
     def validate_features(self, features: List[float]) -> bool:
         """Validate input features"""
         if len(features) != len(self.feature_names):
-            print(f"Expected {len(self.feature_names)} features, got {len(features)}")
+            logger.debug("Expected %d features, got %d", len(self.feature_names), len(features))
             return False
         
+        # NaN, infinity and values that overflow the model's input dtype are
+        # rejected: sklearn refuses infinity, and the compiled forest walk in
+        # _forest_predict_proba would route NaN differently from sklearn
+        for value in features:
+            if not -self._max_input_value <= value <= self._max_input_value:
+                logger.debug("Features must be finite numbers")
+                return False
+        
         # Check for reasonable ranges
         outstanding_debt, credit_mix, credit_history_age, monthly_balance, \
         payment_behaviour, annual_income, delayed_payments = features
         
         if outstanding_debt < 0:
-            print("Outstanding debt cannot be negative")
+            logger.debug("Outstanding debt cannot be negative")
             return False
         
-        if credit_mix not in [0, 1, 2]:
-            print("Credit mix must be 0, 1, or 2")
+        if credit_mix not in (0, 1, 2):
+            logger.debug("Credit mix must be 0, 1, or 2")
             return False
             
         if credit_history_age < 0:
-            print("Credit history age cannot be negative")
+            logger.debug("Credit history age cannot be negative")
             return False
             
         if annual_income < 0:
-            print("Annual income cannot be negative")
+            logger.debug("Annual income cannot be negative")
             return False
             
         if delayed_payments < 0:
-            print("Delayed payments cannot be negative")
+            logger.debug("Delayed payments cannot be negative")
             return False
         
         return True
     
-    def predict_credit_score(self, features: List[float]) -> Dict[str, Any]:
+    def validate_features_batch(self, arr: np.ndarray) -> np.ndarray:
+        """
+        Validate an (N, 7) feature array column-wise
+        
+        Applies the same range checks as validate_features with one numpy
+        reduction per column instead of per-row Python comparisons.
+        
+        Returns:
+            Boolean mask of the rows that pass validation
+        """
+        if arr.ndim != 2 or arr.shape[1] != len(self.feature_names):
+            raise ValueError(
+                f"Expected an (N, {len(self.feature_names)}) feature array, got shape {arr.shape}"
+            )
+        
+        # NaN, infinity and values that overflow the model's input dtype
+        valid = (np.abs(arr) <= self._max_input_value).all(axis=1)
+        
+        # Outstanding_Debt, Credit_History_Age, Annual_Income, Num_of_Delayed_Payment
+        valid &= (arr[:, [0, 2, 5, 6]] >= 0).all(axis=1)
+        valid &= np.isin(arr[:, 1], (0, 1, 2))
+        return valid
+    
+    def predict_credit_score(self, features: List[float], need_proba: bool = True,
+                             need_importance: bool = True) -> Dict[str, Any]:
         """
         Predict credit score category using the trained model
         
@@ -100,9 +523,14 @@ class CreditMLService:
             features: List of 7 features in order:
                 [Outstanding_Debt, Credit_Mix, Credit_History_Age, Monthly_Balance,
                  Payment_Behaviour, Annual_Income, Num_of_Delayed_Payment]
+            need_proba: Compute class probabilities and confidence. When False
+                only the label is predicted and the default confidence is used.
+            need_importance: Attach the model's feature importances
         
         Returns:
-            Dictionary with prediction results
+            Dictionary with prediction results. The input is echoed back
+            as a list under 'feature_values', in the order of feature_names
+            (see get_model_info).
         """
         try:
             if not self.validate_features(features):
@@ -111,65 +539,45 @@ class CreditMLService:
             if self.model is None:
                 raise RuntimeError("Model not loaded")
             
-            # Prepare features for prediction
-            features_array = np.array([features])
-            
-            # Make prediction
-            prediction = self.model.predict(features_array)[0]
-            
-            # Get prediction probabilities if available
-            confidence = 0.85  # Default confidence
-            probabilities = None
-            
-            if hasattr(self.model, 'predict_proba'):
-                try:
-                    proba = self.model.predict_proba(features_array)[0]
-                    probabilities = {
-                        self.credit_categories[i]: float(prob) 
-                        for i, prob in enumerate(proba)
-                    }
-                    confidence = float(max(proba))
-                except Exception as e:
-                    print(f"Could not get probabilities: {e}")
-            
-            # Get feature importance if available
-            feature_importance = None
-            if hasattr(self.model, 'feature_importances_'):
-                try:
-                    importance = self.model.feature_importances_
-                    feature_importance = {
-                        self.feature_names[i]: float(imp) 
-                        for i, imp in enumerate(importance)
-                    }
-                except Exception as e:
-                    print(f"Could not get feature importance: {e}")
+            strategy = self._strategy if need_proba else self._label_strategy
+            prediction, confidence, probabilities, feature_importance = strategy.score(features)
             
             # Convert prediction to credit score range
             credit_score = self.convert_category_to_score(prediction, confidence)
             
             result = {
                 'success': True,
-                'prediction_category': int(prediction),
+                'prediction_category': prediction,
                 'prediction_label': self.credit_categories[prediction],
                 'credit_score_estimate': credit_score,
                 'confidence': confidence,
                 'probabilities': probabilities,
-                'feature_importance': feature_importance,
-                'model_type': type(self.model).__name__,
-                'features_used': dict(zip(self.feature_names, features))
+                'feature_importance': feature_importance if need_importance else None,
+                'model_type': self._model_type_name,
+                'feature_values': self._feature_values(features)
             }
             
             return result
             
         except Exception as e:
-            return {
-                'success': False,
-                'error': str(e),
-                'prediction_category': None,
-                'prediction_label': None,
-                'credit_score_estimate': None,
-                'confidence': None
-            }
+            return self._error_result(e)
+    
+    @staticmethod
+    def _error_result(error: Exception) -> Dict[str, Any]:
+        """Build the result returned for a failed prediction"""
+        return {
+            'success': False,
+            'error': str(error),
+            'prediction_category': None,
+            'prediction_label': None,
+            'credit_score_estimate': None,
+            'confidence': None
+        }
+    
+    @staticmethod
+    def _feature_values(features: List[float]) -> List[float]:
+        """The input features as a plain list, so results stay JSON-serializable"""
+        return features.tolist() if isinstance(features, np.ndarray) else list(features)
     
     def convert_category_to_score(self, category: int, confidence: float) -> int:
         """Convert model category to credit score range"""
@@ -183,26 +591,145 @@ class CreditMLService:
         
         # Add variance based on confidence
         variance = int((1 - confidence) * 50)
-        adjustment = np.random.randint(-variance, variance + 1)
+        adjustment = int(self._rng.integers(-variance, variance + 1))
         
         final_score = base_score + adjustment
         return max(300, min(850, final_score))
     
+    def convert_categories_to_scores(self, categories: np.ndarray, confidences: np.ndarray) -> np.ndarray:
+        """Vectorized convert_category_to_score, drawing all adjustments at once"""
+        categories = np.ascontiguousarray(categories, dtype=np.int64)
+        variances = ((1 - np.asarray(confidences)) * 50).astype(np.int64)
+        adjustments = self._rng.integers(-variances, variances + 1, dtype=np.int64)
+        
+        kernels = _numba_kernels()
+        if kernels is not None:
+            return kernels.scores_from_categories(categories, adjustments)
+        
+        return np.clip(_BASE_SCORES[categories] + adjustments, 300, 850)
+    
     def batch_predict(self, features_list: List[List[float]]) -> List[Dict[str, Any]]:
-        """Predict for multiple feature sets"""
-        results = []
-        for features in features_list:
-            result = self.predict_credit_score(features)
-            results.append(result)
+        """
+        Predict for multiple feature sets
+        
+        Valid rows are stacked into a single (N, 7) array and scored with one
+        model call, so sklearn's per-call overhead is paid once per batch
+        instead of once per row. Invalid rows, including rows of the wrong
+        length, go through predict_credit_score so they report the same errors
+        as single predictions without affecting the rest of the batch.
+        """
+        if len(features_list) == 0:
+            return []
+        
+        if self.model is None:
+            return [self.predict_credit_score(features) for features in features_list]
+        
+        n_features = len(self.feature_names)
+        stackable = np.array([
+            i for i, features in enumerate(features_list)
+            if hasattr(features, '__len__') and len(features) == n_features
+        ], dtype=np.intp)
+        
+        try:
+            raw = np.array([features_list[i] for i in stackable]).reshape(-1, n_features)
+            # Casting would turn '5' into 5.0 and None into NaN; leave
+            # non-numeric input to predict_credit_score, which reports it
+            if raw.dtype.kind not in 'biuf':
+                raise TypeError(f"Non-numeric features of dtype {raw.dtype}")
+            
+            # Validated as float64, like single rows: casting to float32 first
+            # would round 1.00000001 to 1.0 and -1e-50 to -0.0, both valid.
+            # Column-major, so each feature column the validation reads is contiguous.
+            arr = np.asarray(raw, dtype=np.float64, order='F')
+            valid = self.validate_features_batch(arr)
+        except (TypeError, ValueError):
+            return [self.predict_credit_score(features) for features in features_list]
+        
+        valid_rows = stackable[valid]
+        
+        results: List[Dict[str, Any]] = [None] * len(features_list)
+        is_valid = np.zeros(len(features_list), dtype=bool)
+        is_valid[valid_rows] = True
+        for i in np.flatnonzero(~is_valid).tolist():
+            results[i] = self.predict_credit_score(features_list[i])
+        
+        if len(valid_rows) == 0:
+            return results
+        
+        try:
+            # sklearn wants rows contiguous, in the model's input dtype
+            valid_arr = np.ascontiguousarray(arr[valid], dtype=self._input_dtype)
+            
+            # As in predict_credit_score, labels come from the probabilities
+            # instead of a second pass over the model with predict, and a
+            # failing predict_proba is an error rather than a cue to fall back
+            if self._predict_proba is not None:
+                probas = self._predict_rows(self._predict_proba, valid_arr)
+                best = probas.argmax(axis=1)
+                predictions = self._classes[best]
+                confidences = probas[np.arange(len(best)), best]
+                probabilities = [
+                    dict(zip(self._category_labels, proba)) for proba in probas.tolist()
+                ]
+            else:
+                predictions = self._predict_rows(self._predict, valid_arr).astype(np.int64)
+                confidences = np.full(len(valid_rows), DEFAULT_CONFIDENCE)
+                probabilities = [None] * len(valid_rows)
+            
+            credit_scores = self.convert_categories_to_scores(predictions, confidences).tolist()
+            labels = np.take(self._category_names, predictions).tolist()
+            categories = predictions.tolist()
+            confidences = confidences.tolist()
+        
+        except Exception as e:
+            # One row the model rejects fails the whole call; score the rows
+            # one at a time so only that row reports the error
+            logger.warning("Batch prediction failed, scoring rows individually: %s", e)
+            for row in valid_rows.tolist():
+                results[row] = self.predict_credit_score(features_list[row])
+            return results
+        
+        for j, row in enumerate(valid_rows.tolist()):
+            results[row] = {
+                'success': True,
+                'prediction_category': categories[j],
+                'prediction_label': labels[j],
+                'credit_score_estimate': credit_scores[j],
+                'confidence': confidences[j],
+                'probabilities': probabilities[j],
+                'feature_importance': self._feature_importance_dict,
+                'model_type': self._model_type_name,
+                'feature_values': self._feature_values(features_list[row])
+            }
+        
         return results
     
+    def _predict_rows(self, predict_fn, arr: np.ndarray) -> np.ndarray:
+        """
+        Apply predict_fn to arr, splitting large batches across threads
+        
+        sklearn's tree code releases the GIL, so chunks scored on threads run
+        in parallel. Run with OMP_NUM_THREADS=1 (and a model n_jobs of 1) when
+        n_jobs > 1 so the model's own thread pools don't oversubscribe the CPUs.
+        """
+        if self.n_jobs <= 1 or len(arr) < PARALLEL_MIN_ROWS:
+            return predict_fn(arr)
+        
+        from joblib import Parallel, delayed
+        
+        chunks = np.array_split(arr, self.n_jobs)
+        results = Parallel(n_jobs=self.n_jobs, prefer='threads')(
+            delayed(predict_fn)(chunk) for chunk in chunks
+        )
+        return np.concatenate(results)
+    
     def get_model_info(self) -> Dict[str, Any]:
         """Get information about the loaded model"""
         if self.model is None:
             return {'error': 'Model not loaded'}
         
         info = {
-            'model_type': type(self.model).__name__,
+            'model_type': self._model_type_name,
             'feature_names': self.feature_names,
             'credit_categories': self.credit_categories,
             'model_loaded': True
@@ -220,31 +747,53 @@ class CreditMLService:
 
 def main():
     """Main function for command line usage"""
-    if len(sys.argv) < 2:
-        print("Usage: python python_ml_service.py <command> [args...]")
+    # Service messages go to stderr; stdout carries only command output
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
+    args = sys.argv[1:]
+    use_onnx = '--onnx' in args
+    if use_onnx:
+        args.remove('--onnx')
+    
+    if len(args) < 1:
+        print("Usage: python python_ml_service.py [--onnx] <command> [args...]")
         print("Commands:")
         print("  predict <features>  - Predict credit score")
         print("  info               - Get model information")
         print("  test               - Run test prediction")
+        print("  batch <csv_file>   - Predict every row of a CSV, one JSON result per line")
+        print("  serve              - Read JSON feature lists from stdin, one per line,")
+        print("                       and write one JSON result per line")
+        print("  export-onnx        - Convert the joblib model to ONNX")
+        print("Options:")
+        print("  --onnx             - Use the ONNX model with onnxruntime")
+        return
+    
+    command = args[0].lower()
+    
+    if command == 'export-onnx':
+        try:
+            export_onnx_model(DEFAULT_MODEL_PATH, DEFAULT_ONNX_MODEL_PATH)
+            print(f"Exported ONNX model to {DEFAULT_ONNX_MODEL_PATH}")
+        except Exception as e:
+            print(f"Failed to export ONNX model: {e}")
         return
     
     # Initialize service
     try:
-        service = CreditMLService()
+        service = CreditMLService(DEFAULT_ONNX_MODEL_PATH if use_onnx else DEFAULT_MODEL_PATH)
     except Exception as e:
         print(f"Failed to initialize ML service: {e}")
         return
     
-    command = sys.argv[1].lower()
-    
     if command == 'predict':
-        if len(sys.argv) < 9:
+        if len(args) < 8:
             print("Error: Need 7 feature values")
             print("Features: Outstanding_Debt, Credit_Mix, Credit_History_Age, Monthly_Balance, Payment_Behaviour, Annual_Income, Num_of_Delayed_Payment")
             return
         
         try:
-            features = [float(x) for x in sys.argv[2:9]]
+            features = [float(x) for x in args[1:8]]
             result = service.predict_credit_score(features)
             print(json.dumps(result, indent=2))
         except ValueError as e:
@@ -276,6 +825,50 @@ def main():
             else:
                 print(f"Error: {result['error']}")
     
+    elif command == 'serve':
+        # The model is loaded once and reused for every request line
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                result = service.predict_credit_score(json.loads(line))
+            except ValueError as e:
+                result = CreditMLService._error_result(ValueError(f"Invalid JSON: {e}"))
+            sys.stdout.write(json.dumps(result) + '\n')
+            sys.stdout.flush()
+    
+    elif command == 'batch':
+        if len(args) < 2:
+            print("Error: Need a CSV file with one row of 7 feature values per line")
+            return
+        
+        try:
+            with open(args[1], newline='') as f:
+                rows = [row for row in csv.reader(f) if row]
+            
+            # Skip a header row
+            try:
+                float(rows[0][0])
+            except (IndexError, ValueError):
+                rows = rows[1:]
+            
+        except OSError as e:
+            print(f"Error reading features: {e}")
+            return
+        
+        features_list = []
+        for row in rows:
+            try:
+                features_list.append([float(x) for x in row])
+            except ValueError:
+                # Passed on unconverted, so batch_predict reports it as
+                # that row's error instead of failing the whole file
+                features_list.append(row)
+        
+        for result in service.batch_predict(features_list):
+            sys.stdout.write(json.dumps(result) + '\n')
+    
     else:
         print(f"Unknown command: {command}")
 